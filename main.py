@@ -1,8 +1,18 @@
 #!/usr/bin/env python3
 
+import argparse
+import errno
+import glob
+import hashlib
+import mmap
 import os
+import queue
+import shlex
+import shutil
 import subprocess
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Available quantization types
 QUANTIZATION_TYPES = [
@@ -19,28 +29,342 @@ QUANTIZATION_TYPES = [
     "Q6_K",
     "Q8_0",
 ]
+_QUANT_SET = frozenset(QUANTIZATION_TYPES)
+
+# Approximate bits per weight of each quantization type, used to order
+# the work by output size and to estimate the disk space it needs
+QUANT_BITS_PER_WEIGHT = {
+    "Q2_K": 3.00,
+    "Q3_K_S": 3.50,
+    "Q3_K_M": 3.91,
+    "Q3_K_L": 4.27,
+    "Q4_0": 4.50,
+    "Q4_K_S": 4.58,
+    "Q4_K_M": 4.89,
+    "Q4_1": 5.00,
+    "Q5_K_S": 5.54,
+    "Q5_K_M": 5.69,
+    "Q6_K": 6.56,
+    "Q8_0": 8.50,
+}
+
+# Bytes hashed from the start, middle and end of a GGUF when fingerprinting
+FINGERPRINT_SAMPLE = 64 * 1024 * 1024
+
+# Model weight files checked when deciding whether the f16 GGUF is stale
+WEIGHT_EXTENSIONS = (".safetensors", ".bin", ".pt")
+
+# llama.cpp tools, relative to the working directory
+CONVERT_SCRIPT = "./llama/convert_hf_to_gguf.py"
+QUANTIZER = "./llama/bin/llama-quantize"
+IMATRIX_TOOL = "./llama/bin/llama-imatrix"
+
+# Text used to compute the importance matrix for K-quants, if present
+CALIBRATION_FILE = "calibration.txt"
+
+# Upper bound on llama-quantize processes running at the same time
+MAX_PARALLEL_QUANTS = 4
+
+# Niceness added to background quantizers so the terminal stays responsive
+QUANT_NICENESS = 5
+
+# Keeps buffered output of parallel commands from interleaving
+_print_lock = threading.Lock()
+
+
+def set_scheduling(pid, priority=0, cpus=None):
+    """Lower a process's priority and pin it to a set of CPUs where supported"""
+    try:
+        if priority and hasattr(os, "setpriority"):
+            niceness = os.getpriority(os.PRIO_PROCESS, 0) + priority
+            os.setpriority(os.PRIO_PROCESS, pid, niceness)
+        if cpus and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(pid, cpus)
+    except OSError:
+        # Best effort: the process may already have exited
+        pass
+
+
+def run_command(argv, description, capture=False, priority=0, cpus=None):
+    """Run a command (argument list, no shell) and handle errors
+
+    With capture=True the command output is buffered and printed in one
+    block when it finishes, so parallel commands don't interleave.
+    priority and cpus are passed on to set_scheduling for the child.
+    """
+    lines = [f"\n{description}", f"Running: {shlex.join(argv)}", "-" * 50]
+    if not capture:
+        print("\n".join(lines))
+        lines = []
 
-
-def run_command(command, description):
-    """Run a shell command and handle errors"""
-    print(f"\n{description}")
-    print(f"Running: {command}")
-    print("-" * 50)
-
+    try:
+        # When capturing, drain the pipe through a large buffer: far fewer
+        # read() calls and the child never stalls on a full pipe
+        with subprocess.Popen(
+            argv,
+            stdout=subprocess.PIPE if capture else None,
+            stderr=subprocess.STDOUT if capture else None,
+            bufsize=1 << 20 if capture else -1,
+            text=True,
+            errors="replace",
+        ) as proc:
+            # Applied after the spawn rather than in a preexec_fn, which is
+            # unsafe with threads and disables the posix_spawn fast path
+            set_scheduling(proc.pid, priority, cpus)
+            if capture:
+                output = proc.stdout.read().rstrip()
+                if output:
+                    lines.append(output)
+        returncode = proc.returncode
+    except OSError as e:
+        lines.append(f"Error during {description}")
+        lines.append(f"Could not start command: {e}")
+        returncode = None
+
+    if returncode == 0:
+        lines.append(f"{description} completed successfully")
+    elif returncode is not None:
+        lines.append(f"Error during {description}")
+        lines.append(f"Command failed with return code: {returncode}")
+
+    with _print_lock:
+        print("\n".join(lines))
+    return returncode == 0
+
+
+def quantizer_supports(quantizer, flag):
+    """Check whether the quantizer build lists a flag in its help output"""
     try:
         result = subprocess.run(
-            command, shell=True, check=True, capture_output=False, text=True
+            [quantizer, "--help"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
         )
-        print(f"{description} completed successfully")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"Error during {description}")
-        print(f"Command failed with return code: {e.returncode}")
+    except OSError:
+        return False
+    return flag in result.stdout
+
+
+def drop_page_cache(path):
+    """Ask the kernel to evict a file's cached pages (Linux only)"""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+def is_newer(path, mtime):
+    """Check whether path exists and was modified after mtime"""
+    try:
+        return os.path.getmtime(path) > mtime
+    except OSError:
         return False
 
 
+def copy_preallocated(src, dst):
+    """Copy src to dst in the kernel, reserving dst's full size (Linux)
+
+    copy_file_range is tried first: it can reflink or copy server-side on
+    filesystems that support it. sendfile covers kernels and filesystem
+    pairs that don't.
+    """
+    # dst gets preallocated to the full size, so an incomplete copy would
+    # look complete: remove it on every failure so the caller never removes
+    # src and no later run mistakes it for a finished file
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+            size = os.fstat(src_fd).st_size
+            preallocated = False
+            use_copy_file_range = hasattr(os, "copy_file_range")
+            offset = 0
+            while offset < size:
+                count = min(size - offset, 1 << 30)
+                if use_copy_file_range:
+                    # dst's file position advances the same way as with sendfile,
+                    # so switching over midway stays consistent
+                    try:
+                        sent = os.copy_file_range(src_fd, dst_fd, count, offset)
+                    except OSError:
+                        sent = 0
+                    if not sent:
+                        # Unsupported for this filesystem pair, or the known
+                        # quirk of returning 0 before EOF; finish with sendfile
+                        use_copy_file_range = False
+                        continue
+                else:
+                    sent = os.sendfile(dst_fd, src_fd, offset, count)
+                    if not sent:
+                        break
+                offset += sent
+                # Once the copy is known to work, reserve the rest so the
+                # filesystem lays dst out contiguously instead of growing it
+                # one extent at a time
+                if not preallocated:
+                    preallocated = True
+                    try:
+                        os.posix_fallocate(dst_fd, 0, size)
+                    except OSError:
+                        pass
+        if offset != size:
+            raise OSError(errno.EIO, f"Copied only {offset} of {size} bytes", src)
+    except BaseException:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        raise
+    shutil.copystat(src, dst)
+
+
+def fingerprint_gguf(path):
+    """Return "<size> <digest>" for a GGUF file, or None if it isn't one
+
+    Only the start, middle and end are hashed, which is enough to catch a
+    truncated or overwritten file without reading tens of GB.
+    """
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < 4:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:4] != b"GGUF":
+                    return None
+                digest = hashlib.blake2b()
+                if size <= 3 * FINGERPRINT_SAMPLE:
+                    digest.update(mm)
+                else:
+                    middle = (size - FINGERPRINT_SAMPLE) // 2
+                    digest.update(mm[:FINGERPRINT_SAMPLE])
+                    digest.update(mm[middle : middle + FINGERPRINT_SAMPLE])
+                    digest.update(mm[-FINGERPRINT_SAMPLE:])
+    except (OSError, ValueError):
+        return None
+    return f"{size} {digest.hexdigest()}"
+
+
+def move_file(src, folder):
+    """Move a file into folder, copying when it is on another filesystem"""
+    dst = os.path.join(folder, os.path.basename(src))
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        if sys.platform.startswith("linux"):
+            copy_preallocated(src, dst)
+            os.remove(src)
+        else:
+            # shutil.copyfile uses the OS's fast copy path where available
+            shutil.move(src, dst, copy_function=shutil.copyfile)
+    return dst
+
+
+def parse_args(argv=None):
+    """Parse command line options for non-interactive runs"""
+    parser = argparse.ArgumentParser(
+        description="Convert a HuggingFace model to GGUF and quantize it. "
+        "Without options, the settings are asked for interactively."
+    )
+    parser.add_argument("--model", help="model directory path")
+    parser.add_argument(
+        "--output", help="output filename prefix (default: model directory name)"
+    )
+    parser.add_argument(
+        "--quants",
+        help="comma-separated quantization types, or 'all' (default: all)",
+    )
+    parser.add_argument(
+        "--calibration",
+        default=CALIBRATION_FILE,
+        help="text file used to compute an importance matrix for K-quants "
+        f"(default: {CALIBRATION_FILE}, skipped if missing)",
+    )
+    parser.add_argument(
+        "-y",
+        "--yes",
+        action="store_true",
+        help="continue if the model directory is missing and remove the f16 "
+        "base file after quantizing",
+    )
+    args = parser.parse_args(argv)
+
+    args.interactive = all(
+        value is None for value in (args.model, args.output, args.quants)
+    )
+    if args.interactive:
+        return args
+
+    if not args.model:
+        parser.error("--model is required when --output or --quants is given")
+
+    if not args.quants or args.quants.strip().lower() == "all":
+        args.quants = QUANTIZATION_TYPES.copy()
+    else:
+        # Drop duplicates so no type is quantized twice
+        args.quants = list(
+            dict.fromkeys(t.strip().upper() for t in args.quants.split(","))
+        )
+        invalid_types = [t for t in args.quants if t not in _QUANT_SET]
+        if invalid_types:
+            parser.error(
+                f"invalid quantization types: {', '.join(invalid_types)} "
+                f"(valid types: {', '.join(QUANTIZATION_TYPES)})"
+            )
+
+    return args
+
+
+def get_args_input(args):
+    """Get model path and quantization selection from parsed options"""
+    model_path = args.model
+    if not os.path.exists(model_path):
+        print(f"Warning: Directory '{model_path}' does not exist")
+        if not args.yes:
+            print("Pass --yes to continue anyway")
+            sys.exit(1)
+
+    output_name = args.output or os.path.basename(model_path.rstrip("/"))
+    return model_path, output_name, args.quants
+
+
+def enable_path_completion():
+    """Tab-complete file system paths at input() prompts where readline exists"""
+    try:
+        import readline
+    except ImportError:
+        # Not available on Windows
+        return
+
+    matches = []
+
+    def complete(text, state):
+        if state == 0:
+            matches[:] = [
+                path + "/" if os.path.isdir(path) else path
+                for path in sorted(glob.glob(os.path.expanduser(text) + "*"))
+            ]
+        return matches[state] if state < len(matches) else None
+
+    readline.set_completer_delims(" \t\n")
+    readline.set_completer(complete)
+    if "libedit" in (readline.__doc__ or ""):
+        readline.parse_and_bind("bind ^I rl_complete")
+    else:
+        readline.parse_and_bind("tab: complete")
+
+
 def get_user_input():
     """Get user input for model path and quantization selection"""
+    enable_path_completion()
     print("Llama.cpp Model Converter and Quantizer")
     print("=" * 50)
 
@@ -106,10 +430,13 @@ def get_user_input():
                     selected_quants = QUANTIZATION_TYPES.copy()
                     break
 
-                custom_types = [t.strip().upper() for t in custom_input.split(",")]
+                # Drop duplicates so no type is quantized twice
+                custom_types = list(
+                    dict.fromkeys(t.strip().upper() for t in custom_input.split(","))
+                )
 
                 # Validate custom types
-                invalid_types = [t for t in custom_types if t not in QUANTIZATION_TYPES]
+                invalid_types = [t for t in custom_types if t not in _QUANT_SET]
                 if invalid_types:
                     print(f"❌ Invalid quantization types: {', '.join(invalid_types)}")
                     print(f"Valid types: {', '.join(QUANTIZATION_TYPES)}")
@@ -126,87 +453,386 @@ def get_user_input():
     return model_path, output_name, selected_quants
 
 
-def convert_to_gguf(model_path, output_name):
-    """Convert HuggingFace model to GGUF format"""
-    f16_file = f"{output_name}-f16.gguf"
+def convert_to_gguf(model_path, output_name, tools, output_dir="", gguf_folder=None):
+    """Convert HuggingFace model to GGUF format
+
+    tools maps each llama.cpp tool path to whether it was found at startup.
+    The f16 file is written to output_dir (default: working directory); an
+    up-to-date one left there or in gguf_folder by an earlier run is reused.
+    """
+    f16_name = f"{output_name}-f16.gguf"
+    f16_file = os.path.join(output_dir, f16_name)
+
+    # Skip the conversion if the f16 is newer than every weight file
+    try:
+        weight_mtimes = [
+            os.path.getmtime(os.path.join(model_path, f))
+            for f in os.listdir(model_path)
+            if f.endswith(WEIGHT_EXTENSIONS)
+        ]
+    except OSError:
+        weight_mtimes = []
+    # The sidecar records the fingerprint taken right after conversion. It
+    # stays in the working directory, out of the folder that gets uploaded,
+    # and still applies after the f16 is moved since moves keep the content
+    fingerprint_file = f"{f16_name}.sha"
+    candidates = [f16_file]
+    if gguf_folder and os.path.join(gguf_folder, f16_name) != f16_file:
+        candidates.append(os.path.join(gguf_folder, f16_name))
+    for candidate in candidates:
+        if not (weight_mtimes and is_newer(candidate, max(weight_mtimes))):
+            continue
+        try:
+            with open(fingerprint_file) as f:
+                recorded = f.read().strip()
+        except OSError:
+            recorded = None
+        if not recorded:
+            print(f"\nNo fingerprint recorded for existing {candidate}, ignoring it")
+        elif recorded == fingerprint_gguf(candidate):
+            print(f"\n♻️ Reusing existing {candidate} (newer than model weights)")
+            return candidate
+        else:
+            print(
+                f"\n⚠️ Existing {candidate} doesn't match its fingerprint, ignoring it"
+            )
 
     # Check if conversion script exists
-    convert_script = "./llama/convert_hf_to_gguf.py"
-    if not os.path.exists(convert_script):
-        print(f"❌ Conversion script not found: {convert_script}")
+    if not tools[CONVERT_SCRIPT]:
+        print(f"❌ Conversion script not found: {CONVERT_SCRIPT}")
         print("Make sure you're running this from the llama.cpp directory")
         return None
 
-    command = (
-        f"python3 {convert_script} ./{model_path} --outfile {f16_file} --outtype f16"
-    )
-
-    success = run_command(command, f"Converting {model_path} to GGUF format")
-
-    if success and os.path.exists(f16_file):
+    argv = [
+        sys.executable,
+        CONVERT_SCRIPT,
+        model_path,
+        "--outfile",
+        f16_file,
+        "--outtype",
+        "f16",
+    ]
+
+    success = run_command(argv, f"Converting {model_path} to GGUF format")
+
+    # Check the output once here so a broken f16 fails the run up front
+    # instead of failing every quantization that reads it
+    fingerprint = fingerprint_gguf(f16_file) if success else None
+    if fingerprint:
+        try:
+            with open(fingerprint_file, "w") as f:
+                f.write(fingerprint + "\n")
+        except OSError as e:
+            print(f"⚠️ Could not write {fingerprint_file}: {e}")
         return f16_file
     else:
         print(f"❌ Failed to create {f16_file}")
         return None
 
 
-def quantize_model(f16_file, output_name, quant_types):
-    """Quantize the GGUF model with specified quantization types"""
-    quantizer = "./llama/bin/llama-quantize"
+def compute_imatrix(
+    f16_file, output_name, calibration_file, tools, output_dir="", gguf_folder=None
+):
+    """Compute an importance matrix for the K-quants, once per f16 file
+
+    An up-to-date one in output_dir or gguf_folder is reused. Returns the
+    imatrix path, or None if it can't be computed.
+    """
+    imatrix_name = f"{output_name}.imatrix"
+    imatrix_file = os.path.join(output_dir, imatrix_name)
+    candidates = [imatrix_file]
+    if gguf_folder:
+        candidates.append(os.path.join(gguf_folder, imatrix_name))
+    f16_mtime = os.path.getmtime(f16_file)
+    for candidate in candidates:
+        if is_newer(candidate, f16_mtime):
+            print(f"\n♻️ Reusing existing {candidate} (newer than {f16_file})")
+            return candidate
+
+    if not os.path.exists(calibration_file):
+        print(f"\nNo {calibration_file} found, quantizing without an imatrix")
+        return None
+    if not tools[IMATRIX_TOOL]:
+        print(f"\n⚠️ {IMATRIX_TOOL} not found, quantizing without an imatrix")
+        return None
 
+    # Write under a temporary name, like the quants: llama-imatrix saves
+    # partial checkpoints, which a later run must not reuse as complete
+    part_file = f"{imatrix_file}.part"
+    argv = [IMATRIX_TOOL, "-m", f16_file, "-f", calibration_file, "-o", part_file]
+    success = run_command(argv, "Computing importance matrix")
+
+    try:
+        if success:
+            os.replace(part_file, imatrix_file)
+        else:
+            os.remove(part_file)
+    except OSError:
+        success = False
+
+    if success:
+        return imatrix_file
+    else:
+        print("⚠️ Failed to compute the imatrix, quantizing without it")
+        return None
+
+
+def quantize_model(
+    f16_file,
+    output_name,
+    quant_types,
+    tools,
+    output_dir="",
+    imatrix_file=None,
+    gguf_folder=None,
+):
+    """Quantize the GGUF model with specified quantization types
+
+    Outputs are written to output_dir (default: working directory); ones
+    left there or in gguf_folder by an earlier run are reused if still up
+    to date. If imatrix_file is given it is used for the K-quants.
+    Returns (successful, failed): successful is a list of
+    (quant_type, path, size_in_bytes) tuples, failed a list of quant types.
+    """
     # Check if quantizer exists
-    if not os.path.exists(quantizer):
-        print(f"❌ Quantizer not found: {quantizer}")
+    if not tools[QUANTIZER]:
+        print(f"❌ Quantizer not found: {QUANTIZER}")
         print("Make sure you have the llama.cpp release binary")
-        return False
+        return [], list(quant_types)
 
     successful_quants = []
     failed_quants = []
 
+    # Run the smallest outputs first so failures surface early, and skip
+    # the ones that would not fit in the remaining disk space
+    quant_types = sorted(quant_types, key=QUANT_BITS_PER_WEIGHT.get)
+    f16_stat = os.stat(f16_file)
+    imatrix_mtime = os.path.getmtime(imatrix_file) if imatrix_file else 0
+    free_space = shutil.disk_usage(output_dir or ".").free
+    pending_quants = []
+
+    def output_path(quant_type):
+        return os.path.join(output_dir, f"{output_name}-{quant_type}.gguf")
+
+    def find_up_to_date(quant_type):
+        candidates = [output_path(quant_type)]
+        if gguf_folder:
+            candidates.append(
+                os.path.join(gguf_folder, os.path.basename(candidates[0]))
+            )
+        # K-quants also depend on the imatrix they were made with
+        source_mtime = f16_stat.st_mtime
+        if imatrix_file and "_K" in quant_type:
+            source_mtime = max(source_mtime, imatrix_mtime)
+        for candidate in candidates:
+            try:
+                candidate_stat = os.stat(candidate)
+            except OSError:
+                continue
+            if candidate_stat.st_mtime > source_mtime:
+                return candidate, candidate_stat.st_size
+        return None
+
     for quant_type in quant_types:
-        output_file = f"{output_name}-{quant_type}.gguf"
-        command = f"{quantizer} {f16_file} {output_file} {quant_type}"
+        existing = find_up_to_date(quant_type)
+        if existing:
+            print(f"\n♻️ Reusing existing {existing[0]} (newer than its inputs)")
+            successful_quants.append((quant_type, *existing))
+            continue
+
+        estimate = f16_stat.st_size * QUANT_BITS_PER_WEIGHT[quant_type] / 16 * 1.1
+        if estimate > free_space:
+            print(
+                f"❌ Skipping {quant_type}: not enough disk space "
+                f"(needs ~{estimate / (1024 * 1024):.1f} MB)"
+            )
+            failed_quants.append(quant_type)
+            continue
 
-        success = run_command(command, f"Quantizing to {quant_type}")
+        free_space -= estimate
+        pending_quants.append(quant_type)
 
-        if success and os.path.exists(output_file):
-            successful_quants.append(quant_type)
-            # Get file size for reference
-            file_size = os.path.getsize(output_file) / (1024 * 1024)  # MB
-            print(f"📦 Created {output_file} ({file_size:.1f} MB)")
+    # Each output is independent, so run several quantizers at once and
+    # split the CPU threads between them to avoid oversubscription
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    workers = max(1, min(len(pending_quants), MAX_PARALLEL_QUANTS, len(cpus)))
+    threads = max(1, len(cpus) // workers)
+
+    # Give each worker its own disjoint range of CPUs to pin its quantizer to
+    cpu_slots = queue.Queue()
+    for i in range(workers):
+        cpu_slots.put(set(cpus[i * threads : (i + 1) * threads]))
+
+    # Newer builds can bypass the page cache when reading the f16 input.
+    # Only worth it for a single reader: parallel quantizers share the
+    # cached f16, so it is read from disk once instead of once per worker
+    io_flags = []
+    if workers == 1 and quantizer_supports(QUANTIZER, "--direct-io"):
+        io_flags = ["--direct-io"]
+
+    def quantize(quant_type):
+        """Run one quantization; returns the output size, or None on failure"""
+        output_file = output_path(quant_type)
+
+        # The f16 was verified after conversion; a matching size and mtime
+        # is enough to trust it hasn't changed since
+        try:
+            current = os.stat(f16_file)
+            unchanged = current.st_size == f16_stat.st_size
+            unchanged = unchanged and current.st_mtime_ns == f16_stat.st_mtime_ns
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            with _print_lock:
+                print(f"❌ Skipping {quant_type}: {f16_file} changed or disappeared")
+            return None
+
+        flags = list(io_flags)
+        if imatrix_file and "_K" in quant_type:
+            flags += ["--imatrix", imatrix_file]
+        # Write under a temporary name so a failed or interrupted run never
+        # leaves a partial file that a later run would reuse as up to date
+        part_file = f"{output_file}.part"
+        argv = [QUANTIZER, *flags, f16_file, part_file, quant_type, str(threads)]
+        if workers == 1:
+            success = run_command(argv, f"Quantizing to {quant_type}")
         else:
-            failed_quants.append(quant_type)
+            slot = cpu_slots.get()
+            try:
+                success = run_command(
+                    argv,
+                    f"Quantizing to {quant_type}",
+                    capture=True,
+                    priority=QUANT_NICENESS,
+                    cpus=slot,
+                )
+            finally:
+                cpu_slots.put(slot)
+        try:
+            if success:
+                os.replace(part_file, output_file)
+            else:
+                os.remove(part_file)
+        except OSError:
+            success = False
+        if not success:
+            return None
+
+        # Get file size once here and hand it back to the caller; this
+        # also confirms the output exists without a separate probe.
+        # Printed by the worker so it can't land inside the output of an
+        # uncaptured quantizer that is still running
+        try:
+            size_bytes = os.path.getsize(output_file)
+        except OSError:
+            return None
+        file_size = size_bytes / (1024 * 1024)  # MB
+        with _print_lock:
+            print(f"📦 Created {output_file} ({file_size:.1f} MB)")
+        return size_bytes
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(quantize, q): q for q in pending_quants}
+        try:
+            for future in as_completed(futures):
+                quant_type = futures[future]
+                size_bytes = future.result()
+                if size_bytes is None:
+                    failed_quants.append(quant_type)
+                else:
+                    successful_quants.append(
+                        (quant_type, output_path(quant_type), size_bytes)
+                    )
+        except BaseException:
+            # On Ctrl-C the running quantizers get the signal too; make sure
+            # none of the queued ones start before the interrupt propagates
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+    # Report in size order rather than completion order
+    successful_quants.sort(key=lambda item: quant_types.index(item[0]))
+    failed_quants.sort(key=quant_types.index)
 
     return successful_quants, failed_quants
 
 
 def main():
     """Main function"""
+    args = parse_args()
+
     try:
+        # Probe the llama.cpp tools once, and early, instead of before each use
+        tools = {
+            path: os.path.exists(path)
+            for path in (CONVERT_SCRIPT, QUANTIZER, IMATRIX_TOOL)
+        }
+        for path in (CONVERT_SCRIPT, QUANTIZER):
+            if not tools[path]:
+                print(f"⚠️ Warning: {path} not found")
+
         # Get user input
-        model_path, output_name, selected_quants = get_user_input()
+        if args.interactive:
+            model_path, output_name, selected_quants = get_user_input()
+        else:
+            model_path, output_name, selected_quants = get_args_input(args)
 
         print("\nStarting conversion process...")
         print(f"Model path: {model_path}")
         print(f"Output name: {output_name}")
         print(f"Quantization types: {', '.join(selected_quants)}")
 
+        # Create the output folder before any heavy work so a bad location
+        # fails fast instead of after conversion and quantization
+        gguf_folder = f"{output_name}-GGUF"
+        try:
+            os.makedirs(gguf_folder, exist_ok=True)
+            print(f"Created folder: {gguf_folder}/")
+        except OSError as e:
+            print(f"❌ Failed to create {gguf_folder}/: {e}")
+            sys.exit(1)
+
+        # A single quant is written straight into the folder, which skips
+        # the move phase and the f16 cleanup prompt
+        single_quant = len(selected_quants) == 1
+        output_dir = gguf_folder if single_quant else ""
+
         # Step 1: Convert to GGUF
         print("\nStep 1: Converting to GGUF format")
-        f16_file = convert_to_gguf(model_path, output_name)
+        f16_file = convert_to_gguf(
+            model_path, output_name, tools, output_dir, gguf_folder
+        )
 
         if not f16_file:
             print("❌ Conversion failed. Exiting.")
             sys.exit(1)
 
         # Get f16 file size
-        f16_size = os.path.getsize(f16_file) / (1024 * 1024)  # MB
+        f16_bytes = os.path.getsize(f16_file)
+        f16_size = f16_bytes / (1024 * 1024)  # MB
         print(f"📦 Created {f16_file} ({f16_size:.1f} MB)")
 
         # Step 2: Quantize
         print("\nStep 2: Quantizing model")
+
+        # The imatrix is expensive, so compute it once and share it
+        # between all K-quants
+        imatrix_file = None
+        if any("_K" in quant for quant in selected_quants):
+            imatrix_file = compute_imatrix(
+                f16_file, output_name, args.calibration, tools, output_dir, gguf_folder
+            )
+
         successful_quants, failed_quants = quantize_model(
-            f16_file, output_name, selected_quants
+            f16_file,
+            output_name,
+            selected_quants,
+            tools,
+            output_dir,
+            imatrix_file,
+            gguf_folder,
         )
 
         # Summary
@@ -215,7 +841,7 @@ def main():
 
         if successful_quants:
             print(f"✅ Successfully created {len(successful_quants)} quantized models:")
-            for quant in successful_quants:
+            for quant, _, _ in successful_quants:
                 print(f"   - {output_name}-{quant}.gguf")
 
         if failed_quants:
@@ -225,70 +851,90 @@ def main():
 
         # List all created files
         print("\n📁 Processing completed successfully!")
-        print(f"All GGUF files have been moved to: {gguf_folder}/")
-
-        # Move all GGUF files to separate folder
-        print("\nMoving GGUF files to separate folder...")
-        gguf_folder = f"{output_name}-GGUF"
+        if single_quant:
+            print(f"All GGUF files were written to: {gguf_folder}/")
+        else:
+            print(f"All GGUF files have been moved to: {gguf_folder}/")
 
-        try:
-            # Create the folder if it doesn't exist
-            os.makedirs(gguf_folder, exist_ok=True)
-            print(f"Created folder: {gguf_folder}/")
+            # Move all GGUF files to separate folder
+            print("\nMoving GGUF files to separate folder...")
 
-            moved_files = []
+            try:
+                # Sizes were recorded as each file was created, so nothing
+                # needs to be stat'ed again for the summary
+                file_sizes = {f16_file: f16_bytes}
+                for _, path, size_bytes in successful_quants:
+                    file_sizes[path] = size_bytes
+                # Files reused from the folder are already in place
+                moved_files = [
+                    path for path in file_sizes if os.path.dirname(path) != gguf_folder
+                ]
+
+                # Moves are independent, so issue them concurrently
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    list(executor.map(lambda f: move_file(f, gguf_folder), moved_files))
+
+                for filename in moved_files:
+                    print(f"Moved {filename}")
+
+                # Keep the imatrix with the quants it was used for
+                if imatrix_file:
+                    imatrix_in_folder = imatrix_file
+                    if os.path.dirname(imatrix_file) != gguf_folder:
+                        imatrix_in_folder = move_file(imatrix_file, gguf_folder)
+                        print(f"Moved {imatrix_file}")
+                    file_sizes[imatrix_in_folder] = os.path.getsize(imatrix_in_folder)
 
-            # Move f16 base file
-            if os.path.exists(f16_file):
-                new_f16_path = os.path.join(gguf_folder, f16_file)
-                os.rename(f16_file, new_f16_path)
-                moved_files.append(f16_file)
-                print(f"Moved {f16_file}")
+                print(
+                    f"\nSuccessfully moved {len(moved_files)} GGUF files to {gguf_folder}/"
+                )
 
-            # Move all quantized files
-            for quant in successful_quants:
-                quant_file = f"{output_name}-{quant}.gguf"
-                if os.path.exists(quant_file):
-                    new_quant_path = os.path.join(gguf_folder, quant_file)
-                    os.rename(quant_file, new_quant_path)
-                    moved_files.append(quant_file)
-                    print(f"Moved {quant_file}")
+                # Show the files from this run with sizes; anything else
+                # already in the folder is left out
+                print(f"\nFiles from this run in {gguf_folder}/:")
+                for path in sorted(file_sizes, key=os.path.basename):
+                    size = file_sizes[path] / (1024 * 1024)  # MB
+                    print(f"   {os.path.basename(path)} ({size:.1f} MB)")
 
-            print(
-                f"\nSuccessfully moved {len(moved_files)} GGUF files to {gguf_folder}/"
-            )
-
-            # Show final folder contents with sizes
-            print(f"\nFinal contents of {gguf_folder}/:")
-            try:
-                for filename in sorted(os.listdir(gguf_folder)):
-                    if filename.endswith(".gguf"):
-                        filepath = os.path.join(gguf_folder, filename)
-                        size = os.path.getsize(filepath) / (1024 * 1024)  # MB
-                        print(f"   {filename} ({size:.1f} MB)")
             except Exception as e:
-                print(f"   Could not list folder contents: {e}")
-
-        except Exception as e:
-            print(f"Failed to create/move files to {gguf_folder}/: {e}")
-            print("Files remain in current directory")
+                print(f"Failed to move files to {gguf_folder}/: {e}")
+                print("Files remain in current directory")
 
         # Optional cleanup of f16 file
-        f16_in_folder = os.path.join(gguf_folder, f16_file)
+        f16_name = os.path.basename(f16_file)
+        f16_in_folder = os.path.join(gguf_folder, f16_name)
         if os.path.exists(f16_in_folder) and successful_quants:
-            cleanup = (
-                input(
-                    f"\nRemove the f16 base file ({f16_file}) from {gguf_folder}/? (y/n): "
+            if args.yes:
+                cleanup = "y"
+            elif not args.interactive or single_quant:
+                # Batch and single-quant runs never block on a prompt
+                cleanup = "n"
+            else:
+                cleanup = (
+                    input(
+                        f"\nRemove the f16 base file ({f16_name}) from {gguf_folder}/? (y/n): "
+                    )
+                    .strip()
+                    .lower()
                 )
-                .strip()
-                .lower()
-            )
             if cleanup == "y":
                 try:
                     os.remove(f16_in_folder)
-                    print(f"Removed {f16_file} from {gguf_folder}/")
+                    print(f"Removed {f16_name} from {gguf_folder}/")
                 except Exception as e:
-                    print(f"Failed to remove {f16_file}: {e}")
+                    print(f"Failed to remove {f16_name}: {e}")
+                # Its fingerprint no longer describes anything
+                try:
+                    os.remove(f"{f16_name}.sha")
+                except OSError:
+                    pass
+
+        # Nothing reads the f16 after the move and cleanup, don't let it
+        # crowd out the page cache
+        if os.path.exists(f16_in_folder):
+            drop_page_cache(f16_in_folder)
+        elif os.path.exists(f16_file):
+            drop_page_cache(f16_file)
 
     except KeyboardInterrupt:
         print("\n\nProcess interrupted by user")